@@ -1,7 +1,16 @@
+import os
+from contextlib import asynccontextmanager
+
 import fastapi
+from anyio import to_thread
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.cache import get_cached_graph_view, get_graph_version, get_graph_view, stream_graph_view
 from app.logic import (
     create_graph,
     delete_node_by_name,
+    get_db,
     graph_as_adj,
     graph_as_lists,
     graph_as_reverse_adj,
@@ -15,7 +24,22 @@ from app.schemas import (
     HTTPValidationError,
 )
 
-app = fastapi.FastAPI()
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", "100"))
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    """
+    Configure the service on startup.
+
+    Handlers talk to the database synchronously and run in the anyio worker
+    threadpool, so its size caps the number of concurrent requests.
+    """
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
+
+
+app = fastapi.FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 @app.get("/")
@@ -37,12 +61,13 @@ def healthcheck():
     responses={400: {"model": ErrorResponse}, 422: {"model": HTTPValidationError}},
     operation_id="create_graph_api_graph__post",
 )
-def create_graph_api(request: GraphCreate) -> (GraphCreateResponse|ErrorResponse|HTTPValidationError):
+def create_graph_api(request: GraphCreate, db: Session = fastapi.Depends(get_db)) -> ORJSONResponse:
     """
     Create a new graph.
 
     Args:
         request (GraphCreate): Request body containing a list of nodes and a list of edges.
+        db (Session): database session.
 
     Returns:
         Response:
@@ -50,8 +75,8 @@ def create_graph_api(request: GraphCreate) -> (GraphCreateResponse|ErrorResponse
             - ErrorResponse: error object if graph invalid.
             - HTTPValidationError: a list of validation errors if input data doesn't match schema or invalid.
     """
-    response = create_graph(request)
-    return response
+    response = create_graph(request, db)
+    return ORJSONResponse(response.model_dump(), status_code=201)
 
 
 @app.get(
@@ -60,20 +85,24 @@ def create_graph_api(request: GraphCreate) -> (GraphCreateResponse|ErrorResponse
     responses={404: {"model": ErrorResponse}, 422: {"model": HTTPValidationError}},
     operation_id="read_graph_api_graph__graph_id___get",
 )
-def get_graph_as_lists(graph_id: int) -> (GraphReadResponse|ErrorResponse|HTTPValidationError):
+def get_graph_as_lists(graph_id: int, db: Session = fastapi.Depends(get_db)) -> fastapi.Response:
     """
     Represent the graph as a list of nodes and edges.
 
     Args:
         graph_id (int): The identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
         - GraphReadResponse: object containing lists of nodes and edges.
         - ErrorResponse: error object if graph not found.
         - HTTPValidationError: validation error if parameter is invalid.
     """
-    response = graph_as_lists(graph_id)
-    return response
+    version = get_graph_version(graph_id)
+    if (body := get_cached_graph_view(graph_id, version, "lists")) is not None:
+        return fastapi.Response(content=body, media_type="application/json")
+    chunks = stream_graph_view(graph_id, version, "lists", graph_as_lists(graph_id, db))
+    return StreamingResponse(chunks, media_type="application/json")
 
 
 @app.get(
@@ -82,12 +111,13 @@ def get_graph_as_lists(graph_id: int) -> (GraphReadResponse|ErrorResponse|HTTPVa
     responses={404: {"model": ErrorResponse}, 422: {"model": HTTPValidationError}},
     operation_id="get_adjacency_list_api_graph__graph_id__adjacency_list_get",
 )
-def get_graph_as_adj(graph_id: int) -> (AdjacencyListResponse|ErrorResponse|HTTPValidationError):
+def get_graph_as_adj(graph_id: int, db: Session = fastapi.Depends(get_db)) -> fastapi.Response:
     """
     Represent the graph as a direct adjacency list.
 
     Args:
         graph_id (int): The identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
         Response:
@@ -95,8 +125,8 @@ def get_graph_as_adj(graph_id: int) -> (AdjacencyListResponse|ErrorResponse|HTTP
             - ErrorResponse: error object if graph not found.
             - HTTPValidationError: validation error if parameter is invalid.
     """
-    response = graph_as_adj(graph_id)
-    return response
+    body = get_graph_view(graph_id, "adjacency_list", lambda: graph_as_adj(graph_id, db))
+    return fastapi.Response(content=body, media_type="application/json")
 
 
 @app.get(
@@ -105,12 +135,13 @@ def get_graph_as_adj(graph_id: int) -> (AdjacencyListResponse|ErrorResponse|HTTP
     responses={404: {"model": ErrorResponse}, 422: {"model": HTTPValidationError}},
     operation_id="get_reverse_adjacency_list_api_graph__graph_id__reverse_adjacency_list_get",
 )
-def get_graph_as_reverse_adj(graph_id: int) -> (AdjacencyListResponse|ErrorResponse|HTTPValidationError):
+def get_graph_as_reverse_adj(graph_id: int, db: Session = fastapi.Depends(get_db)) -> fastapi.Response:
     """
     Represent the graph as a reverse adjacency list.
 
     Args:
         graph_id (int): The identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
         Response:
@@ -118,8 +149,8 @@ def get_graph_as_reverse_adj(graph_id: int) -> (AdjacencyListResponse|ErrorRespo
             - ErrorResponse: error object if graph not found.
             - HTTPValidationError: validation error if parameter is invalid.
     """
-    response = graph_as_reverse_adj(graph_id)
-    return response
+    body = get_graph_view(graph_id, "reverse_adjacency_list", lambda: graph_as_reverse_adj(graph_id, db))
+    return fastapi.Response(content=body, media_type="application/json")
 
 
 @app.delete(
@@ -129,13 +160,14 @@ def get_graph_as_reverse_adj(graph_id: int) -> (AdjacencyListResponse|ErrorRespo
     operation_id="delete_node_api_graph__graph_id__node__node_name__delete",
     responses={404: {"model": ErrorResponse}, 422: {"model": HTTPValidationError}},
 )
-def delete_node(graph_id: int, node_name: str) -> (None|ErrorResponse|HTTPValidationError):
+def delete_node(graph_id: int, node_name: str, db: Session = fastapi.Depends(get_db)) -> (None|ErrorResponse|HTTPValidationError):
     """
     Delete a node from the graph by its name.
 
     Args:
         graph_id (int): The identifier of the graph.
         node_name (str): The name of the node to delete.
+        db (Session): database session.
 
     Returns:
         Response:
@@ -143,6 +175,6 @@ def delete_node(graph_id: int, node_name: str) -> (None|ErrorResponse|HTTPValida
             - ErrorResponse: error object if the node or graph is not found.
             - HTTPValidationError: validation error if parameters are invalid.
     """
-    if response := delete_node_by_name(graph_id, node_name):
+    if response := delete_node_by_name(graph_id, node_name, db):
         return response
     return None
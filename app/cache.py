@@ -0,0 +1,170 @@
+import os
+from typing import Callable, Iterable, Iterator
+
+import redis
+
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))
+CACHE_MAX_BODY_BYTES = int(os.environ.get("CACHE_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+GRAPH_VIEWS = ("lists", "adjacency_list", "reverse_adjacency_list")
+
+client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+
+def version_key(graph_id: int) -> str:
+    """
+    Build the key of the graph cache version.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+
+    Returns:
+        str: cache key.
+    """
+    return f"graph:{graph_id}:version"
+
+
+def graph_key(graph_id: int, version: int, view: str) -> str:
+    """
+    Build the cache key of a graph representation.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+        version (int): cache version of the graph.
+        view (str): name of the graph representation.
+
+    Returns:
+        str: cache key.
+    """
+    return f"graph:{graph_id}:v{version}:{view}"
+
+
+def get_graph_version(graph_id: int) -> int | None:
+    """
+    Get the current cache version of a graph.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+
+    Returns:
+        int | None: cache version, None if Redis is unavailable or the cache is off.
+    """
+    if client is None:
+        return None
+    try:
+        return int(client.get(version_key(graph_id)) or 0)
+    except redis.RedisError:
+        return None
+
+
+def get_cached_graph_view(graph_id: int, version: int | None, view: str) -> bytes | None:
+    """
+    Get the cached JSON body of a graph representation.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+        version (int | None): cache version of the graph.
+        view (str): name of the graph representation.
+
+    Returns:
+        bytes | None: JSON encoded representation, None if it is not cached or the cache is off.
+    """
+    if client is None or version is None:
+        return None
+    try:
+        return client.get(graph_key(graph_id, version, view))
+    except redis.RedisError:
+        return None
+
+
+def cache_graph_view(graph_id: int, version: int | None, view: str, body: bytes) -> None:
+    """
+    Store the JSON body of a graph representation, if the cache is configured.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+        version (int | None): cache version of the graph read before building the body.
+        view (str): name of the graph representation.
+        body (bytes): JSON encoded representation.
+    """
+    if client is None or version is None:
+        return
+    try:
+        client.set(graph_key(graph_id, version, view), body, ex=CACHE_TTL)
+    except redis.RedisError:
+        pass
+
+
+def get_graph_view(graph_id: int, view: str, build: Callable[[], bytes]) -> bytes:
+    """
+    Get the JSON body of a graph representation, using the cache if it is configured.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+        view (str): name of the graph representation.
+        build (Callable[[], bytes]): builds the JSON encoded representation on a cache miss.
+
+    Returns:
+        bytes: JSON encoded representation.
+
+    The version is read before building, so a body built before an invalidation
+    is stored under the old version and is never served again.
+    """
+    version = get_graph_version(graph_id)
+    body = get_cached_graph_view(graph_id, version, view)
+    if body is None:
+        body = build()
+        cache_graph_view(graph_id, version, view, body)
+    return body
+
+
+def stream_graph_view(graph_id: int, version: int | None, view: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Pass through the streamed JSON body of a graph representation and cache it once complete.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+        version (int | None): cache version of the graph read before streaming started.
+        view (str): name of the graph representation.
+        chunks (Iterable[bytes]): chunks of the JSON encoded representation.
+
+    Yields:
+        bytes: the same chunks.
+
+    The body is not cached if the graph was invalidated while it was streamed,
+    or if it is larger than CACHE_MAX_BODY_BYTES, then collecting stops so memory stays bounded.
+    """
+    if client is None or version is None:
+        yield from chunks
+        return
+
+    body = []
+    size = 0
+    for chunk in chunks:
+        if body is not None:
+            size += len(chunk)
+            if size > CACHE_MAX_BODY_BYTES:
+                body = None
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None and get_graph_version(graph_id) == version:
+        cache_graph_view(graph_id, version, view, b"".join(body))
+
+
+def invalidate_graph(graph_id: int) -> None:
+    """
+    Drop all cached representations of a graph by bumping its cache version.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+
+    Runs after the database commit, so Redis failures are not fatal, entries expire after CACHE_TTL.
+    """
+    if client is None:
+        return
+    try:
+        client.incr(version_key(graph_id))
+    except redis.RedisError:
+        pass
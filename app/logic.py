@@ -1,18 +1,22 @@
+import hashlib
 import os
-from contextlib import contextmanager
+import sqlite3
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Iterable, Iterator
 
 from fastapi import HTTPException
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import IntegrityError
+import orjson
+from sqlalchemy import Engine, String, create_engine, delete, event, exists, insert, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, aliased, sessionmaker
+from sqlalchemy.sql.expression import FunctionElement
 
+from app.cache import invalidate_graph
 from app.models import EdgeModel, GraphModel, NodeModel, Base
 from app.schemas import (
-    AdjacencyListResponse,
     GraphCreate,
     GraphCreateResponse,
-    GraphReadResponse,
-    HTTPValidationError,
     ValidationError,
 )
 
@@ -24,16 +28,47 @@ DATABASE_URL = os.environ.get(
     f"{os.environ.get('DB_PORT','5432')}/postgres"
 )
 
-engine = create_engine(DATABASE_URL)
+STREAM_BATCH_SIZE = 10_000
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "40"))
+
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_use_lifo=True,
+)
+
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    """
+    Turn on foreign key enforcement for SQLite connections, so ON DELETE CASCADE applies.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.create_all(bind=engine)
 
-@contextmanager
+VALID_PAYLOADS_CACHE_SIZE = 1024
+_valid_payloads = OrderedDict()
+_valid_payloads_lock = Lock()
+
+_SourceNode = aliased(NodeModel)
+_TargetNode = aliased(NodeModel)
+
+
 def get_db():
     """
-    Provide a database session.
+    Provide a database session, FastAPI dependency.
 
     Yields:
         Session: SQLAlchemy Session object.
@@ -47,298 +82,445 @@ def get_db():
         db.close()
 
 
-def is_acyclic(nodes: list[str], edges: list[tuple[str, str]]) -> bool:
+def _ensure_graph_exists(db: Session, graph_id: int) -> None:
     """
-    Check directed graph is acyclic.
+    Check the graph exists.
 
     Args:
-        nodes(List[str]): list of node names.
-        edges(List[Tuple[str, str]]): list of (source, target) pairs.
+        db (Session): database session.
+        graph_id (int): the identifier of the graph.
+
+    Raises:
+        HTTPException(404): if the graph is not found.
+    """
+    graph = db.execute(
+        select(GraphModel.id).where(GraphModel.id == graph_id)
+    ).scalar_one_or_none()
+    if graph is None:
+        raise HTTPException(404, "Graph not found")
+
+
+def _edge_names_query(graph_id: int):
+    """
+    Build a query selecting (source name, target name) pairs of the graph edges.
+
+    Args:
+        graph_id (int): the identifier of the graph.
 
     Returns:
-        bool: True if no cycle exists, False otherwise.
+        Select: SQLAlchemy select statement.
+    """
+    return (
+        select(_SourceNode.name, _TargetNode.name)
+        .select_from(EdgeModel)
+        .join(_SourceNode, EdgeModel.source_id == _SourceNode.id)
+        .join(_TargetNode, EdgeModel.target_id == _TargetNode.id)
+        .where(EdgeModel.graph_id == graph_id)
+    )
+
+
+class _JsonArrayAgg(FunctionElement):
     """
-    graph = {}
+    Aggregate values into a JSON array.
+    """
+    inherit_cache = True
+    name = "json_array_agg"
+
+
+@compiles(_JsonArrayAgg, "postgresql")
+def _compile_json_array_agg_postgresql(element, compiler, **kw) -> str:
+    return "json_agg(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(_JsonArrayAgg, "sqlite")
+def _compile_json_array_agg_sqlite(element, compiler, **kw) -> str:
+    return "json_group_array(%s)" % compiler.process(element.clauses, **kw)
+
+
+class _JsonAdjacencyAgg(FunctionElement):
+    """
+    Aggregate (name, JSON array or NULL) pairs into the text of a JSON object, NULL becomes [].
+    """
+    type = String()
+    inherit_cache = True
+    name = "json_adjacency_agg"
 
-    for node in nodes:
-        graph[node] = []
 
-    for edge in edges:
-        graph.get(edge[0], []).append(edge[1])
+@compiles(_JsonAdjacencyAgg, "postgresql")
+def _compile_json_adjacency_agg_postgresql(element, compiler, **kw) -> str:
+    key, value = element.clauses
+    return "CAST(json_object_agg(%s, COALESCE(%s, '[]'::json)) AS TEXT)" % (
+        compiler.process(key, **kw),
+        compiler.process(value, **kw),
+    )
 
-    visited = set()
-    visiting = set()
 
-    def dfs(node: str) -> bool:
-        if node in visiting:
-            return False
-        if node in visited:
-            return True
+@compiles(_JsonAdjacencyAgg, "sqlite")
+def _compile_json_adjacency_agg_sqlite(element, compiler, **kw) -> str:
+    key, value = element.clauses
+    return "json_group_object(%s, json(COALESCE(%s, '[]')))" % (
+        compiler.process(key, **kw),
+        compiler.process(value, **kw),
+    )
 
-        visiting.add(node)
-        for neighbor in graph.get(node, []):
-            if not dfs(neighbor):
-                return False
-        visiting.remove(node)
-        visited.add(node)
-        return True
 
-    for node in nodes:
-        if node not in visited:
-            if not dfs(node):
-                return False
+def _adjacency_list_json(db: Session, graph_id: int, node_fk, neighbor_fk) -> bytes:
+    """
+    Build the JSON encoded adjacency list of the graph in the database.
 
-    return True
+    The graph existence is checked within the same query.
+
+    Args:
+        db (Session): database session.
+        graph_id (int): the identifier of the graph.
+        node_fk (Column): edge column referencing the node the list belongs to.
+        neighbor_fk (Column): edge column referencing the neighbor node.
+
+    Returns:
+        bytes: JSON encoded AdjacencyListResponse.
+
+    Raises:
+        HTTPException(404): if the graph is not found.
+    """
+    neighbor = aliased(NodeModel)
+    neighbors = (
+        select(node_fk.label("node_id"), _JsonArrayAgg(neighbor.name).label("names"))
+        .select_from(EdgeModel)
+        .join(neighbor, neighbor_fk == neighbor.id)
+        .where(EdgeModel.graph_id == graph_id)
+        .group_by(node_fk)
+        .subquery()
+    )
+    graph_exists, adjacency_list = db.execute(
+        select(
+            exists().where(GraphModel.id == graph_id),
+            _JsonAdjacencyAgg(NodeModel.name, neighbors.c.names),
+        )
+        .select_from(NodeModel)
+        .outerjoin(neighbors, neighbors.c.node_id == NodeModel.id)
+        .where(NodeModel.graph_id == graph_id)
+    ).one()
+    if not graph_exists:
+        raise HTTPException(404, "Graph not found")
+    return b'{"adjacency_list":' + (adjacency_list or "{}").encode() + b"}"
+
+
+def is_acyclic(adj: list[list[int]], indeg: list[int]) -> bool:
+    """
+    Check directed graph is acyclic.
+
+    Uses iterative Kahn's topological sort, so deep graphs don't hit the recursion limit.
+
+    Args:
+        adj(List[List[int]]): target node indices of each node's outgoing edges.
+        indeg(List[int]): number of incoming edges of each node, consumed by the check.
+
+    Returns:
+        bool: True if no cycle exists, False otherwise.
+    """
+    queue = deque(i for i, d in enumerate(indeg) if d == 0)
+    processed = 0
+    while queue:
+        u = queue.popleft()
+        processed += 1
+        for v in adj[u]:
+            indeg[v] -= 1
+            if indeg[v] == 0:
+                queue.append(v)
+
+    return processed == len(adj)
 
 
 def validate_data(data: GraphCreate) -> None:
     """
     Validate graph creation data.
 
+    Hashes of recently accepted payloads are remembered, so a retried request skips the checks.
+
     Args:
         data (GraphCreate): input data with nodes and edges.
 
     Raises:
         HTTPException(422):
             - if no nodes in graph.
-            - if node names are non-alphabetic or too long(>255).
             - if duplicate node names exist.
             - if any edge contains unknown nodes.
+            - if any edge is repeated, in the same or opposite direction.
             - if the graph contains a cycle.
     """
-    errors = HTTPValidationError(detail=[])
+    payload_key = hashlib.blake2b(data.model_dump_json().encode(), digest_size=16).digest()
+    with _valid_payloads_lock:
+        if payload_key in _valid_payloads:
+            _valid_payloads.move_to_end(payload_key)
+            return None
+
+    errors = []
     if len(data.nodes) == 0:
-        errors.detail.append(
-            ValidationError(
+        errors.append(
+            ValidationError.model_construct(
                 loc=["body", "nodes"],
                 msg="There aren't any vertex!",
                 type="value_error",
             )
         )
 
-    if any(not node.name.isalpha() for node in data.nodes):
-        errors.detail.append(
-            ValidationError(
+    node_index = {}
+    duplicate_name = False
+    for node in data.nodes:
+        name = node.name
+        if name in node_index:
+            duplicate_name = True
+        else:
+            node_index[name] = len(node_index)
+
+    if duplicate_name:
+        errors.append(
+            ValidationError.model_construct(
                 loc=["body", "nodes"],
-                msg="There are nodes with incorrect names!",
-                type="value_error",
-            )
-        )
-
-    if any(len(node.name) > 255 for node in data.nodes):
-        errors.detail.append(
-            ValidationError(
-                loc=["body", "nodes"],
-                msg="There are nodes with too long names!",
+                msg="There are vertex with the same name!",
                 type="value_error",
             )
         )
 
-    node_names = [node.name for node in data.nodes]
-    if len(node_names) != len(set(node_names)):
-        errors.detail.append(
-            ValidationError(
+    n = len(node_index)
+    adj = [[] for _ in range(n)]
+    indeg = [0] * n
+    seen_edges = set()
+    incorrect_edges = duplicate_edges = False
+    for edge in data.edges:
+        source = node_index.get(edge.source)
+        target = node_index.get(edge.target)
+        if source is None or target is None:
+            incorrect_edges = True
+            continue
+        edge_key = source * n + target if source < target else target * n + source
+        if edge_key in seen_edges:
+            duplicate_edges = True
+        seen_edges.add(edge_key)
+        adj[source].append(target)
+        indeg[target] += 1
+
+    if incorrect_edges:
+        errors.append(
+            ValidationError.model_construct(
                 loc=["body", "nodes"],
-                msg="There are vertex with the same name!",
+                msg="There are incorrect edges!",
                 type="value_error",
             )
         )
 
-    if set([edge.source for edge in data.edges] + [edge.target for edge in data.edges]) - set(node_names):
-        errors.detail.append(
-            ValidationError(
-                loc=["body", "nodes"],
-                msg="There are incorrect edges!",
+    if duplicate_edges:
+        errors.append(
+            ValidationError.model_construct(
+                loc=["body", "edges"],
+                msg="There are duplicate edges!",
                 type="value_error",
             )
         )
 
-    if not is_acyclic(
-        [node.name for node in data.nodes],
-        [(edge.source, edge.target) for edge in data.edges],
-    ):
-        errors.detail.append(
-            ValidationError(
+    if not is_acyclic(adj, indeg):
+        errors.append(
+            ValidationError.model_construct(
                 loc=["body", "edges"],
                 msg="There is a cycle in graph!",
                 type="value_error.cycle",
             )
         )
-    if errors.detail:
+    if errors:
         raise HTTPException(
             status_code=422,
-            detail=[
-                {
-                    "loc": d.loc,
-                    "msg": d.msg,
-                    "type": d.type
-                }
-                for d in errors.detail
-            ]
-        )    
+            detail=[error.model_dump() for error in errors],
+        )
+
+    with _valid_payloads_lock:
+        _valid_payloads[payload_key] = None
+        if len(_valid_payloads) > VALID_PAYLOADS_CACHE_SIZE:
+            _valid_payloads.popitem(last=False)
     return None
 
 
-def create_graph(data: GraphCreate) -> GraphCreateResponse:
+def create_graph(data: GraphCreate, db: Session) -> GraphCreateResponse:
     """
     Create a new graph.
 
     Args:
         data (GraphCreate): input data with nodes and edges.
+        db (Session): database session.
 
     Returns:
         GraphCreateResponse: contains the created graph's ID.
 
     Raises:
-        HTTPException(400):
-            - if edges contains duplicates.
-            - if general failure to add graph.
+        HTTPException(400): if general failure to add graph.
     """
     validate_data(data)
 
-    with get_db() as db:
-        try:
-            graph = GraphModel()
-            db.add(graph)
-            db.flush()
-
-            nodes = {}
-            for node_data in data.nodes:
-                node = NodeModel(name=node_data.name, graph=graph)
-                db.add(node)
-                nodes[node.name] = node
+    try:
+        graph = GraphModel()
+        db.add(graph)
+        db.flush()
+        graph_id = graph.id
+
+        rows = db.execute(
+            insert(NodeModel).returning(NodeModel.id, NodeModel.name),
+            [{"name": node.name, "graph_id": graph_id} for node in data.nodes],
+        )
+        name_to_id = {row.name: row.id for row in rows}
+
+        if data.edges:
+            db.execute(
+                insert(EdgeModel),
+                [
+                    {
+                        "graph_id": graph_id,
+                        "source_id": name_to_id[edge.source],
+                        "target_id": name_to_id[edge.target],
+                    }
+                    for edge in data.edges
+                ],
+            )
 
-            for edge_data in data.edges:
-                edge = EdgeModel(
-                    graph=graph,
-                    source=nodes[edge_data.source],
-                    target=nodes[edge_data.target],
-                )
-                db.add(edge)
+        db.commit()
 
-            db.commit()
-            db.refresh(graph)
-            return GraphCreateResponse(id=graph.id)
+    except Exception as exc:
+        db.rollback()
+        raise HTTPException(
+            status_code=400, detail="Failed to add graph"
+        ) from exc
 
-        except Exception as exc:
-            db.rollback()
-            raise HTTPException(
-                status_code=400, detail="Failed to add graph"
-            ) from exc
+    invalidate_graph(graph_id)
+    return GraphCreateResponse.model_construct(id=graph_id)
 
 
-def graph_as_lists(graph_id: int) -> GraphReadResponse:
+def graph_as_lists(graph_id: int, db: Session) -> Iterator[bytes]:
     """
     Represent a graph as lists of nodes and edges.
 
+    The graph existence is checked eagerly, the body is streamed from the database
+    in batches of STREAM_BATCH_SIZE rows with a separate session.
+
     Args:
         graph_id (int): the identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
-        GraphReadResponse: contains node and edge lists.
+        Iterator[bytes]: chunks of JSON encoded GraphReadResponse with node and edge lists.
 
     Raises:
         HTTPException(404): if the graph is not found.
     """
-    with get_db() as db:
-        try:
-            graph = db.query(GraphModel).filter(GraphModel.id == graph_id).first()
-        except Exception as exc:
-            raise HTTPException(status_code=404, detail="Graph entity not found") from exc
-        if not graph:
-            raise HTTPException(404, "Graph not found")
-        return GraphReadResponse(
-            id=graph_id,
-            nodes=[{"name": node.name} for node in graph.nodes],
-            edges=[
-                {"source": edge.source.name, "target": edge.target.name}
-                for edge in graph.edges
-            ],
+    _ensure_graph_exists(db, graph_id)
+    return _graph_lists_chunks(graph_id)
+
+
+def _graph_lists_chunks(graph_id: int) -> Iterator[bytes]:
+    """
+    Stream the JSON encoded lists of graph nodes and edges.
+
+    Args:
+        graph_id (int): the identifier of the graph.
+
+    Yields:
+        bytes: chunks of JSON encoded GraphReadResponse.
+    """
+    with SessionLocal() as db:
+        yield b'{"id":%d,"nodes":[' % graph_id
+        nodes = db.execute(
+            select(NodeModel.name)
+            .where(NodeModel.graph_id == graph_id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        yield from _json_array_items(
+            [{"name": name} for name, in rows] for rows in nodes.partitions()
         )
+        yield b'],"edges":['
+        edges = db.execute(
+            _edge_names_query(graph_id).execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        yield from _json_array_items(
+            [{"source": source, "target": target} for source, target in rows]
+            for rows in edges.partitions()
+        )
+        yield b"]}"
+
+
+def _json_array_items(batches: Iterable[list]) -> Iterator[bytes]:
+    """
+    Encode batches of items as comma separated JSON array items, without brackets.
+
+    Args:
+        batches (Iterable[list]): batches of JSON serializable items.
+
+    Yields:
+        bytes: encoded items of one batch.
+    """
+    separator = b""
+    for batch in batches:
+        if batch:
+            yield separator + orjson.dumps(batch)[1:-1]
+            separator = b","
 
 
-def graph_as_adj(graph_id: int) -> AdjacencyListResponse:
+def graph_as_adj(graph_id: int, db: Session) -> bytes:
     """
     Represent a graph as an adjacency list.
 
     Args:
         graph_id (int): the identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
-        AdjacencyListResponse: dict where keys are node names, values are lists of neighbor's names.
+        bytes: JSON encoded AdjacencyListResponse, keys are node names, values are lists of neighbor's names.
 
     Raises:
         HTTPException(404): if the graph is not found.
     """
-    with get_db() as db:
-        try:
-            graph = db.query(GraphModel).filter(GraphModel.id == graph_id).first()
-        except Exception as exc:
-            raise HTTPException(status_code=404, detail="Graph entity not found") from exc
-        if not graph:
-            raise HTTPException(404, "Graph not found")
-        adj = {node.name: [] for node in graph.nodes}
-        for edge in graph.edges:
-            adj[edge.source.name].append(edge.target.name)
-        return AdjacencyListResponse(adjacency_list=adj)
+    return _adjacency_list_json(db, graph_id, EdgeModel.source_id, EdgeModel.target_id)
 
 
-def graph_as_reverse_adj(graph_id: int) -> AdjacencyListResponse:
+def graph_as_reverse_adj(graph_id: int, db: Session) -> bytes:
     """
     Represent a graph as a reverse adjacency list.
 
     Args:
         graph_id (int): the identifier of the graph to represent.
+        db (Session): database session.
 
     Returns:
-        AdjacencyListResponse: dict where keys are node names, values are lists of neighbor's names.
+        bytes: JSON encoded AdjacencyListResponse, keys are node names, values are lists of neighbor's names.
 
     Raises:
         HTTPException(404): if the graph is not found.
     """
-    with get_db() as db:
-        try:
-            graph = db.query(GraphModel).filter(GraphModel.id == graph_id).first()
-        except Exception as exc:
-            raise HTTPException(status_code=404, detail="Graph entity not found") from exc
-        if not graph:
-            raise HTTPException(404, "Graph not found")
-        reverse_adj = {node.name: [] for node in graph.nodes}
-        for edge in graph.edges:
-            reverse_adj[edge.target.name].append(edge.source.name)
-        return AdjacencyListResponse(adjacency_list=reverse_adj)
+    return _adjacency_list_json(db, graph_id, EdgeModel.target_id, EdgeModel.source_id)
 
 
-def delete_node_by_name(graph_id: int, node_name: str) -> None:
+def delete_node_by_name(graph_id: int, node_name: str, db: Session) -> None:
     """
     Delete a node and its connected edges from the graph.
 
+    Edges are removed by the database through ON DELETE CASCADE.
+
     Args:
         graph_id (int): the identifier of the graph.
         node_name (str): name of the node to delete.
+        db (Session): database session.
 
     Raises:
         HTTPException(404):
             - if the graph is not found.
             - if the node is not found.
     """
-    with get_db() as db:
-        try:
-            graph = db.query(GraphModel).filter(GraphModel.id == graph_id).first()
-        except Exception as exc:
-            raise HTTPException(status_code=404, detail="Graph entity not found") from exc
-        if not graph:
-            raise HTTPException(404, "Graph not found")
-
-        node = db.query(NodeModel).filter_by(graph_id=graph_id, name=node_name).first()
-        if not node:
-            raise HTTPException(status_code=404, detail="Node entity not found")
-
-        db.query(EdgeModel).filter(
-            (EdgeModel.source_id == node.id) | (EdgeModel.target_id == node.id)
-        ).delete(synchronize_session=False)
+    result = db.execute(
+        delete(NodeModel).where(
+            NodeModel.graph_id == graph_id, NodeModel.name == node_name
+        )
+    )
+    if result.rowcount == 0:
+        _ensure_graph_exists(db, graph_id)
+        raise HTTPException(status_code=404, detail="Node entity not found")
 
-        db.delete(node)
-        db.commit()
+    db.commit()
+    invalidate_graph(graph_id)
 
-        return None
+    return None
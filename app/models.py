@@ -62,24 +62,23 @@ class EdgeModel(Base):
         source(NodeModel): Reference to the source NodeModel instance.
         target(NodeModel): Reference to the target NodeModel instance.
 
+    Edges are deleted by the database together with their source or target node,
+    source_id and target_id are indexed so the cascade doesn't scan the table.
     Each node name must be unique within the same graph.
     """
     __tablename__ = "edges"
 
     id = Column(Integer, primary_key=True)
     graph_id = Column(Integer, ForeignKey("graphs.id"), nullable=False)
-    source_id = Column(Integer, ForeignKey("nodes.id"), nullable=False)
-    target_id = Column(Integer, ForeignKey("nodes.id"), nullable=False)
+    source_id = Column(
+        Integer, ForeignKey("nodes.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    target_id = Column(
+        Integer, ForeignKey("nodes.id", ondelete="CASCADE"), nullable=False, index=True
+    )
 
     graph = relationship("GraphModel", back_populates="edges")
     source = relationship("NodeModel", foreign_keys=[source_id])
     target = relationship("NodeModel", foreign_keys=[target_id])
 
-    __table_args__ = (
-        UniqueConstraint("graph_id", "source_id", "target_id"),
-        UniqueConstraint(
-            "graph_id",
-            "target_id",
-            "source_id",
-        ),
-    )
+    __table_args__ = (UniqueConstraint("graph_id", "source_id", "target_id"),)
@@ -1,9 +1,11 @@
-from pydantic import BaseModel
-from typing import List, Dict, Union, Any
+from pydantic import BaseModel, StringConstraints
+from typing import Annotated, List, Dict, Union, Any
+
+NodeName = Annotated[str, StringConstraints(pattern=r"^[A-Za-z]+$", min_length=1, max_length=255)]
 
 
 class Node(BaseModel):
-    name: str
+    name: NodeName
 
 class Edge(BaseModel):
     source: str
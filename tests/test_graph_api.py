@@ -1,16 +1,21 @@
 import os
+from collections import OrderedDict
 
+import orjson
 import pytest
+import redis
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 DATABASE_URL = "sqlite:///sqlite"
 os.environ["DATABASE_URL"] = DATABASE_URL
 
+import app.cache as cache_mod
 import app.logic as logic_mod
 from app.api import app
 from app.logic import Base
+from app.models import EdgeModel
 
 test_engine = create_engine(DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
@@ -49,6 +54,23 @@ def test_create_and_get_graph():
     assert {(e["source"], e["target"]) for e in data["edges"]} == {("A", "B"), ("B", "C")}
 
 
+def test_create_same_payload_twice(monkeypatch):
+    calls = []
+    is_acyclic = logic_mod.is_acyclic
+
+    def counting_is_acyclic(adj, indeg):
+        calls.append(1)
+        return is_acyclic(adj, indeg)
+
+    monkeypatch.setattr(logic_mod, "_valid_payloads", OrderedDict())
+    monkeypatch.setattr(logic_mod, "is_acyclic", counting_is_acyclic)
+
+    first_id = create_graph()
+    second_id = create_graph()
+    assert first_id != second_id
+    assert len(calls) == 1
+
+
 def test_duplicate_node():
     payload = {"nodes": [{"name": "A"}, {"name": "A"}], "edges": []}
     resp = client.post("/api/graph/", json=payload)
@@ -73,7 +95,22 @@ def test_incorrect_name():
     assert resp.status_code == 422
 
     details = resp.json()["detail"]
-    assert any("There are nodes with incorrect names!" in err["msg"] for err in details)
+    assert any(
+        err["loc"] == ["body", "nodes", 0, "name"] and err["type"] == "string_pattern_mismatch"
+        for err in details
+    )
+
+
+def test_non_latin_name():
+    payload = {"nodes": [{"name": "Ä"}, {"name": ""}], "edges": []}
+    resp = client.post("/api/graph/", json=payload)
+    assert resp.status_code == 422
+
+    details = resp.json()["detail"]
+    assert {tuple(err["loc"]) for err in details} == {
+        ("body", "nodes", 0, "name"),
+        ("body", "nodes", 1, "name"),
+    }
 
 
 def test_long_name():
@@ -83,7 +120,10 @@ def test_long_name():
     assert resp.status_code == 422
 
     details = resp.json()["detail"]
-    assert any("There are nodes with too long names!" in err["msg"] for err in details)
+    assert any(
+        err["loc"] == ["body", "nodes", 0, "name"] and err["type"] == "string_too_long"
+        for err in details
+    )
 
 
 def test_incorrect_edge():
@@ -98,6 +138,30 @@ def test_incorrect_edge():
     assert any(err["msg"] == "There are incorrect edges!" for err in details)
 
 
+def test_duplicate_edge():
+    payload = {
+        "nodes": [{"name": "A"}, {"name": "B"}],
+        "edges": [{"source": "A", "target": "B"}, {"source": "A", "target": "B"}],
+    }
+    resp = client.post("/api/graph/", json=payload)
+    assert resp.status_code == 422
+
+    details = resp.json()["detail"]
+    assert any(err["msg"] == "There are duplicate edges!" for err in details)
+
+
+def test_opposite_edges():
+    payload = {
+        "nodes": [{"name": "A"}, {"name": "B"}],
+        "edges": [{"source": "A", "target": "B"}, {"source": "B", "target": "A"}],
+    }
+    resp = client.post("/api/graph/", json=payload)
+    assert resp.status_code == 422
+
+    details = resp.json()["detail"]
+    assert any(err["msg"] == "There are duplicate edges!" for err in details)
+
+
 def test_graph_with_cycle():
     payload = {
         "nodes": [{"name": "A"}, {"name": "B"}],
@@ -110,6 +174,16 @@ def test_graph_with_cycle():
     assert any(err["msg"] == "There is a cycle in graph!" for err in details)
 
 
+def test_create_deep_chain_graph():
+    names = ["".join(chr(ord("A") + int(d)) for d in str(i)) for i in range(3000)]
+    payload = {
+        "nodes": [{"name": name} for name in names],
+        "edges": [{"source": s, "target": t} for s, t in zip(names, names[1:])],
+    }
+    resp = client.post("/api/graph/", json=payload)
+    assert resp.status_code == 201
+
+
 def test_graph_as_lists_success():
     graph_id = create_graph()
     resp = client.get(f"/api/graph/{graph_id}/")
@@ -121,6 +195,17 @@ def test_graph_as_lists_success():
     assert {(e["source"], e["target"]) for e in data["edges"]} == {("A", "B"), ("B", "C")}
 
 
+def test_graph_as_lists_streamed_in_batches(monkeypatch):
+    monkeypatch.setattr(logic_mod, "STREAM_BATCH_SIZE", 2)
+    graph_id = create_graph()
+    resp = client.get(f"/api/graph/{graph_id}/")
+    assert resp.status_code == 200
+
+    data = resp.json()
+    assert sorted(n["name"] for n in data["nodes"]) == ["A", "B", "C"]
+    assert {(e["source"], e["target"]) for e in data["edges"]} == {("A", "B"), ("B", "C")}
+
+
 def test_graph_as_lists_not_found():
     resp = client.get("/api/graph/999/")
     assert resp.status_code == 404
@@ -139,6 +224,45 @@ def test_graph_as_adj_success():
     }
 
 
+def test_graph_as_adj_fan_out():
+    payload = {
+        "nodes": [{"name": "A"}, {"name": "B"}, {"name": "C"}, {"name": "D"}],
+        "edges": [
+            {"source": "A", "target": "C"},
+            {"source": "B", "target": "C"},
+            {"source": "A", "target": "B"},
+            {"source": "A", "target": "D"},
+        ],
+    }
+    graph_id = client.post("/api/graph/", json=payload).json()["id"]
+
+    adj = client.get(f"/api/graph/{graph_id}/adjacency_list").json()["adjacency_list"]
+    assert {k: sorted(v) for k, v in adj.items()} == {
+        "A": ["B", "C", "D"],
+        "B": ["C"],
+        "C": [],
+        "D": [],
+    }
+
+    reverse_adj = client.get(f"/api/graph/{graph_id}/reverse_adjacency_list").json()["adjacency_list"]
+    assert {k: sorted(v) for k, v in reverse_adj.items()} == {
+        "A": [],
+        "B": ["A"],
+        "C": ["A", "B"],
+        "D": ["A"],
+    }
+
+
+def test_graph_as_adj_without_nodes():
+    payload = {"nodes": [{"name": "A"}], "edges": []}
+    graph_id = client.post("/api/graph/", json=payload).json()["id"]
+    assert client.delete(f"/api/graph/{graph_id}/node/A").status_code == 204
+
+    resp = client.get(f"/api/graph/{graph_id}/adjacency_list")
+    assert resp.status_code == 200
+    assert resp.json()["adjacency_list"] == {}
+
+
 def test_graph_as_adj_not_found():
     resp = client.get("/api/graph/999/adjacency_list")
     assert resp.status_code == 404
@@ -175,6 +299,28 @@ def test_delete_node_by_name_success():
     assert sorted(n["name"] for n in data["nodes"]) == ["B", "C"]
     assert data["edges"] == [{"source": "B", "target": "C"}]
 
+    with TestingSessionLocal() as db:
+        assert db.query(EdgeModel).filter(EdgeModel.graph_id == graph_id).count() == 1
+
+
+def test_delete_node_by_name_single_statement():
+    graph_id = create_graph()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        resp = client.delete(f"/api/graph/{graph_id}/node/B")
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+
+    assert resp.status_code == 204
+    deletes = [s for s in statements if s.lstrip().upper().startswith("DELETE")]
+    assert len(deletes) == 1
+    assert deletes[0].startswith("DELETE FROM nodes")
+
 
 def test_delete_node_by_name_node_not_found():
     graph_id = create_graph()
@@ -187,3 +333,108 @@ def test_delete_node_by_name_graph_not_found():
     resp = client.delete("/api/graph/999/node/A")
     assert resp.status_code == 404
     assert resp.json()["detail"] == "Graph not found"
+
+
+class InMemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+@pytest.fixture
+def redis_cache(monkeypatch):
+    fake = InMemoryRedis()
+    monkeypatch.setattr(cache_mod, "client", fake)
+    return fake
+
+
+def test_stale_graph_view_not_cached(redis_cache):
+    graph_id = create_graph()
+
+    def build_during_delete():
+        with TestingSessionLocal() as db:
+            body = logic_mod.graph_as_adj(graph_id, db)
+        resp = client.delete(f"/api/graph/{graph_id}/node/C")
+        assert resp.status_code == 204
+        return body
+
+    cache_mod.get_graph_view(graph_id, "adjacency_list", build_during_delete)
+
+    resp = client.get(f"/api/graph/{graph_id}/adjacency_list")
+    assert resp.json()["adjacency_list"] == {"A": ["B"], "B": []}
+
+
+def test_graph_as_lists_not_cached_after_invalidation(redis_cache):
+    graph_id = create_graph()
+    version = cache_mod.get_graph_version(graph_id)
+
+    def chunks_during_delete():
+        yield b"{}"
+        cache_mod.invalidate_graph(graph_id)
+
+    body = b"".join(cache_mod.stream_graph_view(graph_id, version, "lists", chunks_during_delete()))
+    assert body == b"{}"
+    assert f"graph:{graph_id}:v{version}:lists" not in redis_cache.data
+
+
+def test_graph_as_lists_over_cap_not_cached(redis_cache, monkeypatch):
+    graph_id = create_graph()
+    monkeypatch.setattr(cache_mod, "CACHE_MAX_BODY_BYTES", 16)
+
+    resp = client.get(f"/api/graph/{graph_id}/")
+    assert resp.status_code == 200
+    assert len(resp.json()["edges"]) == 2
+    assert not any(key.endswith(":lists") for key in redis_cache.data)
+
+
+def test_graph_views_cached_and_invalidated(redis_cache):
+    graph_id = create_graph()
+    resp = client.get(f"/api/graph/{graph_id}/adjacency_list")
+    assert resp.status_code == 200
+    assert f"graph:{graph_id}:v1:adjacency_list" in redis_cache.data
+
+    resp = client.delete(f"/api/graph/{graph_id}/node/C")
+    assert resp.status_code == 204
+    assert redis_cache.data[f"graph:{graph_id}:version"] == 2
+
+    resp = client.get(f"/api/graph/{graph_id}/adjacency_list")
+    assert resp.json()["adjacency_list"] == {"A": ["B"], "B": []}
+
+
+class UnavailableRedis:
+    def __getattr__(self, name):
+        def unavailable(*args, **kwargs):
+            raise redis.ConnectionError("Redis is unavailable")
+
+        return unavailable
+
+
+def test_mutations_succeed_without_redis(monkeypatch):
+    monkeypatch.setattr(cache_mod, "client", UnavailableRedis())
+    graph_id = create_graph()
+
+    resp = client.delete(f"/api/graph/{graph_id}/node/C")
+    assert resp.status_code == 204
+
+    resp = client.get(f"/api/graph/{graph_id}/adjacency_list")
+    assert resp.json()["adjacency_list"] == {"A": ["B"], "B": []}
+
+
+def test_graph_as_lists_cached(redis_cache):
+    graph_id = create_graph()
+    resp = client.get(f"/api/graph/{graph_id}/")
+    assert resp.status_code == 200
+    assert orjson.loads(redis_cache.data[f"graph:{graph_id}:v1:lists"]) == resp.json()
+
+    resp = client.get(f"/api/graph/{graph_id}/")
+    assert resp.status_code == 200
+    assert sorted(n["name"] for n in resp.json()["nodes"]) == ["A", "B", "C"]